@@ -1,4 +1,6 @@
 import os
+import signal
+import socket
 import logging
 import discord
 from discord.ext import commands
@@ -9,18 +11,23 @@ from dotenv import load_dotenv
 # Charger les variables d'environnement
 load_dotenv()
 
-# --- Logging ---
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    force=True
-)
+# --- Local modules (read their config from the environment at import) ---
+from log_setup import setup_logging
+from mazoku_stream import run_consumer
+from storage import STORAGE_BACKEND, MemoryStorage, RedisStorage
+
+# --- Logging (queue-based, never blocks the event loop) ---
+log_listener = setup_logging()
 log = logging.getLogger("main-bot")
 
 # --- Environment variables ---
 TOKEN = os.getenv("DISCORD_TOKEN")
 REDIS_URL = os.getenv("REDIS_URL")
 GUILD_ID = int(os.getenv("GUILD_ID", "0"))
+# all     = everything in this process (default)
+# gateway = Discord gateway only, parsed Mazoku events go to a Redis Stream
+# worker  = no gateway, consumes the stream (scale with several dynos)
+RUN_MODE = os.getenv("RUN_MODE", "all").lower()
 
 # --- Intents ---
 intents = discord.Intents.default()
@@ -30,6 +37,7 @@ intents.members = True
 
 # --- Bot instance ---
 bot = commands.Bot(command_prefix="!", intents=intents)
+bot.run_mode = RUN_MODE
 
 # --- Redis connection ---
 async def init_redis():
@@ -41,6 +49,18 @@ async def init_redis():
         log.error("❌ Redis connection failed: %s", e)
         bot.redis = None
 
+# --- Storage backend (cogs only talk to bot.store) ---
+async def init_storage():
+    if STORAGE_BACKEND == "memory":
+        bot.redis = None
+        bot.store = MemoryStorage()
+        log.info("✅ In-memory storage ready")
+    else:
+        await init_redis()
+        bot.store = RedisStorage(bot.redis) if bot.redis else None
+    if bot.store:
+        await bot.store.start()
+
 # --- Events ---
 @bot.event
 async def on_ready():
@@ -52,11 +72,32 @@ async def on_ready():
     except Exception as e:
         log.error("❌ Failed to sync commands: %s", e)
 
+# --- Stream worker (RUN_MODE=worker) ---
+async def run_worker():
+    if not bot.redis:
+        raise RuntimeError("❌ RUN_MODE=worker needs a working Redis connection.")
+    consumer = os.getenv("DYNO") or f"{socket.gethostname()}-{os.getpid()}"
+    handlers = {
+        "cooldown": bot.get_cog("Cooldowns").apply_cooldown,
+        "claim": bot.get_cog("Leaderboard").apply_claim,
+    }
+    # REST-only login: workers send messages but never open a gateway session
+    await bot.login(TOKEN)
+    await run_consumer(bot.redis, consumer, handlers, bot.is_closed)
+
 # --- Main entry ---
 async def main():
     async with bot:
-        # Init Redis
-        await init_redis()
+        # Heroku stops dynos with SIGTERM: close the bot so the finally below
+        # runs and the storage gets flushed (memory snapshot)
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+        except NotImplementedError:
+            pass  # Windows: no loop signal handlers
+
+        # Init storage (Redis or in-memory)
+        await init_storage()
 
         # Charger les Cogs
         await bot.load_extension("cogs.leaderboard")
@@ -64,11 +105,27 @@ async def main():
         await bot.load_extension("cogs.cooldowns")
 
         # Démarrer le bot
-        await bot.start(TOKEN)
+        try:
+            if RUN_MODE == "worker":
+                await run_worker()
+            else:
+                await bot.start(TOKEN)
+        finally:
+            if bot.store:
+                await bot.store.close()
 
 if __name__ == "__main__":
     if not TOKEN:
         raise RuntimeError("❌ DISCORD_TOKEN is missing from environment variables.")
-    if not REDIS_URL:
+    if STORAGE_BACKEND not in ("redis", "memory"):
+        raise RuntimeError(f"❌ Unknown STORAGE_BACKEND: {STORAGE_BACKEND} (expected redis or memory)")
+    if STORAGE_BACKEND == "redis" and not REDIS_URL:
         raise RuntimeError("❌ REDIS_URL is missing from environment variables.")
-    asyncio.run(main())
+    if RUN_MODE not in ("all", "gateway", "worker"):
+        raise RuntimeError(f"❌ Unknown RUN_MODE: {RUN_MODE} (expected all, gateway or worker)")
+    if STORAGE_BACKEND == "memory" and RUN_MODE != "all":
+        raise RuntimeError("❌ STORAGE_BACKEND=memory only supports RUN_MODE=all (streams need Redis).")
+    try:
+        asyncio.run(main())
+    finally:
+        log_listener.stop()
@@ -1,10 +1,15 @@
 import os
 import re
 import asyncio
+import logging
 import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import discord
 from discord import app_commands
 from discord.ext import commands
+from mazoku_stream import publish_event
+
+log = logging.getLogger("cog-cooldowns")
 
 # --- IDs (mets-les dans .env si tu veux les rendre dynamiques) ---
 GUILD_ID = int(os.getenv("GUILD_ID", "1196690004852883507"))
@@ -16,9 +21,19 @@ CONTACT_ID = int(os.getenv("CONTACT_ID", "801879772421423115"))
 
 # --- Daily reminder time (UTC) ---
 # Optionnel: DAILY_REMINDER_HHMM="12:00" ou DAILY_REMINDER_UNIX="1758844801"
+# Default time for users who opt in without choosing their own.
 DAILY_REMINDER_HHMM = os.getenv("DAILY_REMINDER_HHMM", "12:00")
 DAILY_REMINDER_UNIX = os.getenv("DAILY_REMINDER_UNIX", "")
 
+# --- Daily reminder timing wheel (one slot per UTC minute of the day) ---
+# Storage layout lives in storage.py (WHEEL_*_KEY)
+WHEEL_SLOTS = 1440
+# Max minutes replayed after a restart (avoids a burst of stale reminders)
+DAILY_WHEEL_CATCHUP_MINUTES = int(os.getenv("DAILY_WHEEL_CATCHUP_MINUTES", "60"))
+
+# --- Cooldown reminders (scheduled in storage, sent by whichever process polls first) ---
+REMINDER_POLL_SECONDS = float(os.getenv("REMINDER_POLL_SECONDS", "5"))
+
 # --- Emojis & Regex ---
 ELAINA_YAY = "<:ElainaYay:1336678776771186753>"
 EMOJI_REGEX = re.compile(r"<a?:\w+:(\d+)>")
@@ -32,17 +47,58 @@ COOLDOWN_SECONDS = {
 }
 
 # --- Utility ---
-async def safe_send(channel: discord.TextChannel, *args, **kwargs):
+async def safe_send(channel: discord.abc.Messageable, *args, **kwargs):
     try:
         return await channel.send(*args, **kwargs)
     except Exception:
         pass
 
 
+def default_daily_hhmm() -> str:
+    if DAILY_REMINDER_UNIX:
+        t = datetime.datetime.fromtimestamp(int(DAILY_REMINDER_UNIX), datetime.timezone.utc)
+        return f"{t.hour:02d}:{t.minute:02d}"
+    return DAILY_REMINDER_HHMM
+
+
+def parse_hhmm(value: str):
+    """Return (hour, minute) for a "HH:MM" string, or None if invalid."""
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*", value or "")
+    if not match:
+        return None
+    hh, mm = int(match.group(1)), int(match.group(2))
+    if hh > 23 or mm > 59:
+        return None
+    return hh, mm
+
+
+def get_zone(name: str):
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def next_wheel_due(hhmm: str, tz_name: str, after: datetime.datetime) -> int:
+    """Absolute minute (epoch // 60) of the next local HH:MM strictly after `after`.
+
+    Its wheel slot is `due % WHEEL_SLOTS`. Recomputed after every send, so
+    DST shifts move the user to the right slot.
+    """
+    hh, mm = parse_hhmm(hhmm) or parse_hhmm(DAILY_REMINDER_HHMM) or (12, 0)
+    zone = get_zone(tz_name) or datetime.timezone.utc
+    local_now = after.astimezone(zone)
+    target = local_now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if target <= local_now:
+        target = (target + datetime.timedelta(days=1)).replace(hour=hh, minute=mm)
+    return int(target.timestamp()) // 60
+
+
 class Cooldowns(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self._daily_task = None
+        self._reminder_task = None
 
     # ----------------
     # Slash commands
@@ -50,8 +106,8 @@ class Cooldowns(commands.Cog):
     @app_commands.command(name="cooldowns", description="Check your active cooldowns")
     @app_commands.guilds(discord.Object(id=GUILD_ID))
     async def cooldowns_cmd(self, interaction: discord.Interaction):
-        if not getattr(self.bot, "redis", None):
-            await interaction.response.send_message("❌ Redis not connected!", ephemeral=True)
+        if not getattr(self.bot, "store", None):
+            await interaction.response.send_message("❌ Storage not connected!", ephemeral=True)
             return
 
         user_id = str(interaction.user.id)
@@ -64,8 +120,7 @@ class Cooldowns(commands.Cog):
 
         found = False
         for cmd in COOLDOWN_SECONDS.keys():
-            key = f"cooldown:{user_id}:{cmd}"
-            ttl = await self.bot.redis.ttl(key)
+            ttl = await self.bot.store.cooldown_ttl(user_id, cmd)
             if ttl > 0:
                 mins, secs = divmod(ttl, 60)
                 embed.add_field(name=f"/{cmd}", value=f"⏱️ {mins}m {secs}s left", inline=False)
@@ -85,8 +140,8 @@ class Cooldowns(commands.Cog):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("❌ You must be an administrator.", ephemeral=True)
             return
-        if not getattr(self.bot, "redis", None):
-            await interaction.response.send_message("❌ Redis not connected.", ephemeral=True)
+        if not getattr(self.bot, "store", None):
+            await interaction.response.send_message("❌ Storage not connected.", ephemeral=True)
             return
 
         user_id = str(member.id)
@@ -95,12 +150,10 @@ class Cooldowns(commands.Cog):
             if command not in COOLDOWN_SECONDS:
                 await interaction.response.send_message(f"⚠️ Unknown command: `{command}`", ephemeral=True)
                 return
-            key = f"cooldown:{user_id}:{command}"
-            deleted = await self.bot.redis.delete(key)
+            deleted = await self.bot.store.clear_cooldown(user_id, command)
         else:
             for cmd in COOLDOWN_SECONDS.keys():
-                key = f"cooldown:{user_id}:{cmd}"
-                deleted += await self.bot.redis.delete(key)
+                deleted += await self.bot.store.clear_cooldown(user_id, cmd)
 
         await interaction.response.send_message(
             f"✅ Cooldowns reset for {member.mention} ({deleted} removed).",
@@ -111,21 +164,20 @@ class Cooldowns(commands.Cog):
     @app_commands.describe(command="The command to toggle reminders for")
     @app_commands.guilds(discord.Object(id=GUILD_ID))
     async def toggle_reminder(self, interaction: discord.Interaction, command: str):
-        if not getattr(self.bot, "redis", None):
-            await interaction.response.send_message("❌ Redis not connected!", ephemeral=True)
+        if not getattr(self.bot, "store", None):
+            await interaction.response.send_message("❌ Storage not connected!", ephemeral=True)
             return
         if command not in COOLDOWN_SECONDS:
             await interaction.response.send_message(f"⚠️ Unknown command: `{command}`", ephemeral=True)
             return
 
         user_id = str(interaction.user.id)
-        key = f"reminder:{user_id}:{command}"
-        current = await self.bot.redis.get(key)
+        current = await self.bot.store.get_reminder(user_id, command)
         if current == "off":
-            await self.bot.redis.set(key, "on")
+            await self.bot.store.set_reminder(user_id, command, "on")
             status = "✅ Reminders enabled"
         else:
-            await self.bot.redis.set(key, "off")
+            await self.bot.store.set_reminder(user_id, command, "off")
             status = "❌ Reminders disabled"
 
         embed = discord.Embed(
@@ -136,22 +188,40 @@ class Cooldowns(commands.Cog):
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @app_commands.command(name="togglereminder-daily", description="Toggle your daily Mazoku reminder")
+    @app_commands.describe(
+        time="Optional: your reminder time as HH:MM (24h)",
+        timezone="Optional: your timezone, e.g. Europe/Paris (default UTC)"
+    )
     @app_commands.guilds(discord.Object(id=GUILD_ID))
-    async def toggle_reminder_daily(self, interaction: discord.Interaction):
-        if not getattr(self.bot, "redis", None):
-            await interaction.response.send_message("❌ Redis not connected!", ephemeral=True)
+    async def toggle_reminder_daily(self, interaction: discord.Interaction, time: str = None, timezone: str = None):
+        if not getattr(self.bot, "store", None):
+            await interaction.response.send_message("❌ Storage not connected!", ephemeral=True)
+            return
+
+        if time is not None and not parse_hhmm(time):
+            await interaction.response.send_message("⚠️ Invalid time, use `HH:MM` (e.g. `18:30`).", ephemeral=True)
+            return
+        if timezone is not None and not get_zone(timezone):
+            await interaction.response.send_message(f"⚠️ Unknown timezone: `{timezone}`", ephemeral=True)
             return
 
         user_id = str(interaction.user.id)
-        key = f"dailyreminder:{user_id}"
-        current = await self.bot.redis.get(key)
+        current = await self.bot.store.get_daily_reminder(user_id)
 
-        if current == "on":
-            await self.bot.redis.set(key, "off")
+        saved, _ = await self.bot.store.get_daily_schedule(user_id)
+        saved_hhmm, _, saved_tz = (saved or "").partition("|")
+        hhmm = time.strip() if time else (saved_hhmm or default_daily_hhmm())
+        tz_name = timezone or saved_tz or "UTC"
+
+        # Passing a time/timezone always (re)enables; otherwise it's a toggle
+        if current == "on" and time is None and timezone is None:
+            await self.bot.store.set_daily_reminder(user_id, "off")
+            await self.bot.store.clear_daily_schedule(user_id)
             status = "❌ Daily reminder disabled"
         else:
-            await self.bot.redis.set(key, "on")
-            status = "✅ Daily reminder enabled"
+            await self.bot.store.set_daily_reminder(user_id, "on")
+            await self._schedule_daily(user_id, hhmm, tz_name)
+            status = f"✅ Daily reminder enabled at **{hhmm}** ({tz_name})"
 
         embed = discord.Embed(
             title="🔔 Daily Reminder Preference Updated",
@@ -193,7 +263,7 @@ class Cooldowns(commands.Cog):
     # ----------------
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if not getattr(self.bot, "redis", None):
+        if not getattr(self.bot, "store", None):
             return
         if message.author.id == self.bot.user.id:
             return
@@ -229,157 +299,227 @@ class Cooldowns(commands.Cog):
                 cmd = "vote"
                 user = message.author
 
-        # ----------------
-        # Apply cooldowns
-        # ----------------
         if user and cmd in COOLDOWN_SECONDS:
-            user_id = str(user.id)
-            key = f"cooldown:{user_id}:{cmd}"
-
-            ttl = await self.bot.redis.ttl(key)
-            if ttl > 0:
-                await safe_send(
-                    message.channel,
-                    content=f"{user.mention}",
-                    embed=discord.Embed(description=f"⏳ You are still on cooldown for `/{cmd}` ({ttl}s left)!")
-                )
-                return
-
-            cd_time = COOLDOWN_SECONDS[cmd]
-            await self.bot.redis.setex(key, cd_time, "1")
-
-            log_channel = message.guild.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                await safe_send(
-                    log_channel,
-                    embed=discord.Embed(
-                        title="📌 Cooldown started",
-                        description=f"For {user.mention} → `/{cmd}` ({cd_time}s)",
-                        color=discord.Color.blue(),
-                        timestamp=datetime.datetime.now(datetime.timezone.utc)
-                    )
-                )
+            record = {
+                "type": "cooldown",
+                "user_id": str(user.id),
+                "cmd": cmd,
+                "channel_id": str(message.channel.id),
+                "message_id": str(message.id),
+                "created_at": message.created_at.timestamp(),
+            }
+            if getattr(self.bot, "run_mode", "all") == "gateway":
+                await publish_event(self.bot.redis, record)
+            else:
+                await self.apply_cooldown(record)
 
-            async def cooldown_task():
-                await asyncio.sleep(cd_time)
-                try:
-                    reminder_key = f"reminder:{user.id}:{cmd}"
-                    reminder_status = await self.bot.redis.get(reminder_key)
-
-                    if reminder_status != "off":
-                        if cmd == "vote":
-                            end_embed = discord.Embed(
-                                title="🗳️ Vote reminder!",
-                                description=(
-                                    f"Your **/{cmd}** cooldown is over.\n\n"
-                                    f"{ELAINA_YAY} You can support Mazoku again on top.gg!"
-                                ),
-                                color=discord.Color.from_rgb(255, 204, 0)
-                            )
-                        else:
-                            end_embed = discord.Embed(
-                                title="🌞 Cooldown finished!",
-                                description=(
-                                    f"Your **/{cmd}** is available again.\n\n"
-                                    f"{ELAINA_YAY} Enjoy this new light\n"
-                                    "✨ MoonQuill is watching over you"
-                                ),
-                                color=discord.Color.from_rgb(255, 204, 0)
-                            )
-                            end_embed.set_footer(text="MoonQuill is watching over you ✨")
-
-                        await safe_send(message.channel, content=f"{user.mention}", embed=end_embed)
-
-                        if log_channel:
-                            await safe_send(
-                                log_channel,
-                                embed=discord.Embed(
-                                    title="📩 Reminder sent",
-                                    description=f"Reminder for `{cmd}` sent to {user.mention} (ID: `{user.id}`)",
-                                    color=discord.Color.green(),
-                                    timestamp=datetime.datetime.now(datetime.timezone.utc)
-                                )
-                            )
-                except Exception:
-                    pass
+    # ----------------
+    # Apply cooldowns (in-process, or from a stream worker)
+    # ----------------
+    async def apply_cooldown(self, record: dict):
+        user_id = record["user_id"]
+        cmd = record["cmd"]
+        mention = f"<@{user_id}>"
+        channel = self.bot.get_partial_messageable(int(record["channel_id"]))
+
+        # --- Dedupe + cooldown check/start + reminder schedule in one atomic step ---
+        # (a redelivered record after a crash is applied, a duplicate is skipped)
+        cd_time = COOLDOWN_SECONDS[cmd]
+        ttl = await self.bot.store.try_start_cooldown(
+            f"cooldownmsg:{record['message_id']}", user_id, cmd, cd_time, record["channel_id"]
+        )
+        if ttl is None:
+            return  # already processed
+        if ttl > 0:
+            await safe_send(
+                channel,
+                content=mention,
+                embed=discord.Embed(description=f"⏳ You are still on cooldown for `/{cmd}` ({ttl}s left)!")
+            )
+            return
 
-            asyncio.create_task(cooldown_task())
+        now = datetime.datetime.now(datetime.timezone.utc)
+        latency_ms = int((now.timestamp() - float(record["created_at"])) * 1000)
+        log.info("⏱️ Cooldown started for %s → /%s (%ss)", user_id, cmd, cd_time,
+                 extra={"user_id": int(user_id), "command": cmd, "latency_ms": latency_ms})
+
+        log_channel = self.bot.get_partial_messageable(LOG_CHANNEL_ID)
+        await safe_send(
+            log_channel,
+            embed=discord.Embed(
+                title="📌 Cooldown started",
+                description=f"For {mention} → `/{cmd}` ({cd_time}s)",
+                color=discord.Color.blue(),
+                timestamp=now
+            )
+        )
 
     # ----------------
-    # Daily reminder background task
+    # End-of-cooldown reminders
     # ----------------
-    async def daily_reminder_task(self):
-        await self.bot.wait_until_ready()
+    async def send_cooldown_reminder(self, user_id: str, cmd: str, channel_id: str):
+        if await self.bot.store.get_reminder(user_id, cmd) == "off":
+            return
 
-        # Determine target time (UTC)
-        if DAILY_REMINDER_UNIX:
-            target_time = datetime.datetime.utcfromtimestamp(int(DAILY_REMINDER_UNIX)).time()
+        mention = f"<@{user_id}>"
+        if cmd == "vote":
+            end_embed = discord.Embed(
+                title="🗳️ Vote reminder!",
+                description=(
+                    f"Your **/{cmd}** cooldown is over.\n\n"
+                    f"{ELAINA_YAY} You can support Mazoku again on top.gg!"
+                ),
+                color=discord.Color.from_rgb(255, 204, 0)
+            )
         else:
-            hh, mm = DAILY_REMINDER_HHMM.split(":")
-            target_time = datetime.time(hour=int(hh), minute=int(mm), tzinfo=datetime.timezone.utc)
-
-        while not self.bot.is_closed():
-            now = datetime.datetime.now(datetime.timezone.utc)
-            today_target = now.replace(
-                hour=target_time.hour,
-                minute=target_time.minute,
-                second=0,
-                microsecond=0
+            end_embed = discord.Embed(
+                title="🌞 Cooldown finished!",
+                description=(
+                    f"Your **/{cmd}** is available again.\n\n"
+                    f"{ELAINA_YAY} Enjoy this new light\n"
+                    "✨ MoonQuill is watching over you"
+                ),
+                color=discord.Color.from_rgb(255, 204, 0)
             )
-            if now >= today_target:
-                today_target += datetime.timedelta(days=1)
-            wait_seconds = (today_target - now).total_seconds()
-            await asyncio.sleep(wait_seconds)
+            end_embed.set_footer(text="MoonQuill is watching over you ✨")
+
+        channel = self.bot.get_partial_messageable(int(channel_id))
+        await safe_send(channel, content=mention, embed=end_embed)
+
+        log_channel = self.bot.get_partial_messageable(LOG_CHANNEL_ID)
+        await safe_send(
+            log_channel,
+            embed=discord.Embed(
+                title="📩 Reminder sent",
+                description=f"Reminder for `{cmd}` sent to {mention} (ID: `{user_id}`)",
+                color=discord.Color.green(),
+                timestamp=datetime.datetime.now(datetime.timezone.utc)
+            )
+        )
 
-            # Send reminders to all opted-in users (stored in Redis)
+    async def cooldown_reminder_task(self):
+        # Reminders live in storage, so a restart or a dead worker only delays them
+        while not self.bot.is_closed():
+            await asyncio.sleep(REMINDER_POLL_SECONDS)
+            if self.bot.user is None:
+                continue  # not logged in yet, can't send
             try:
-                keys = await self.bot.redis.keys("dailyreminder:*")
-            except Exception:
-                keys = []
+                due = await self.bot.store.claim_due_reminders()
+            except Exception as e:
+                log.error("❌ Failed to read cooldown reminders: %s", e)
+                continue
+            for user_id, cmd, channel_id in due:
+                try:
+                    await self.send_cooldown_reminder(user_id, cmd, channel_id)
+                    await self.bot.store.ack_reminder(user_id, cmd, channel_id)
+                except Exception as e:
+                    # Left leased: retried once REMINDER_LEASE expires
+                    log.error("❌ Cooldown reminder failed for %s → /%s: %s", user_id, cmd, e)
+
+    # ----------------
+    # Daily reminder timing wheel
+    # ----------------
+    async def _schedule_daily(self, user_id: str, hhmm: str, tz_name: str):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        due = next_wheel_due(hhmm, tz_name, now)
+        _, old_slot = await self.bot.store.get_daily_schedule(user_id)
+        await self.bot.store.set_daily_schedule(user_id, due % WHEEL_SLOTS, due, f"{hhmm}|{tz_name}", old_slot)
+
+    async def _migrate_daily_optins(self):
+        """Put users who opted in before the wheel existed on the default slot."""
+        try:
+            for user_id in await self.bot.store.daily_reminder_users():
+                _, slot = await self.bot.store.get_daily_schedule(user_id)
+                if slot is None:
+                    await self._schedule_daily(user_id, default_daily_hhmm(), "UTC")
+        except Exception as e:
+            log.error("❌ Daily reminder migration failed: %s", e)
+
+    async def _fire_daily(self, user_id: str):
+        if await self.bot.store.get_daily_reminder(user_id) != "on":
+            # Stale wheel entry (disabled elsewhere): drop it
+            await self.bot.store.clear_daily_schedule(user_id)
+            return
 
-            for key in keys:
+        # Move to the slot of the next occurrence first, so a failed DM
+        # never leaves the user stuck on this minute
+        saved, _ = await self.bot.store.get_daily_schedule(user_id)
+        hhmm, _, tz_name = (saved or "").partition("|")
+        await self._schedule_daily(user_id, hhmm or default_daily_hhmm(), tz_name or "UTC")
+
+        user = self.bot.get_user(int(user_id))
+        if not user:
+            return
+
+        # Send DM
+        try:
+            await user.send("🌻 Your Mazoku daily is ready!")
+        except Exception:
+            return
+
+        # Styled log embed in the log channel
+        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
+        if log_channel:
+            embed = discord.Embed(
+                title="📩 Daily reminder sent",
+                description=f"Sent to <@{user.id}> (ID: `{user.id}`)",
+                color=discord.Color.from_rgb(255, 204, 0),
+                timestamp=datetime.datetime.now(datetime.timezone.utc)
+            )
+            embed.set_footer(text="MoonQuill daily scheduler")
+            await safe_send(log_channel, embed=embed)
+
+    async def _process_wheel(self, now_minute: int):
+        cursor = await self.bot.store.get_wheel_cursor()
+        start = cursor + 1 if cursor is not None else now_minute
+        start = max(start, now_minute - DAILY_WHEEL_CATCHUP_MINUTES)
+
+        for minute in range(start, now_minute + 1):
+            # Members whose due minute is a later day are skipped (DST fall-back
+            # can move the next send to a slot later in the same UTC day)
+            members = await self.bot.store.due_daily(minute % WHEEL_SLOTS, minute)
+            for user_id in members:
                 try:
-                    val = await self.bot.redis.get(key)
-                    if val != "on":
-                        continue
-
-                    user_id = int(key.split(":")[1])
-                    user = self.bot.get_user(user_id)
-                    if not user:
-                        continue
-
-                    # Send DM
-                    try:
-                        await user.send("🌻 Your Mazoku daily is ready!")
-                    except Exception:
-                        continue
-
-                    # Styled log embed in the log channel
-                    log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-                    if log_channel:
-                        embed = discord.Embed(
-                            title="📩 Daily reminder sent",
-                            description=f"Sent to <@{user.id}> (ID: `{user.id}`)",
-                            color=discord.Color.from_rgb(255, 204, 0),
-                            timestamp=datetime.datetime.now(datetime.timezone.utc)
-                        )
-                        embed.set_footer(text="MoonQuill daily scheduler")
-                        await safe_send(log_channel, embed=embed)
+                    await self._fire_daily(user_id)
                 except Exception:
                     continue
+            await self.bot.store.set_wheel_cursor(minute)
+
+    async def daily_reminder_task(self):
+        await self.bot.wait_until_ready()
+        await self._migrate_daily_optins()
+
+        while not self.bot.is_closed():
+            now = datetime.datetime.now(datetime.timezone.utc)
+            try:
+                await self._process_wheel(int(now.timestamp()) // 60)
+            except Exception as e:
+                log.error("❌ Daily reminder tick failed: %s", e)
+
+            # Sleep until the start of the next minute
+            now = datetime.datetime.now(datetime.timezone.utc)
+            await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000)
 
     # ----------------
     # Cog lifecycle
     # ----------------
     async def cog_load(self):
-        # Start the daily reminder task when the cog is loaded
-        self._daily_task = self.bot.loop.create_task(self.daily_reminder_task())
+        # Start the background tasks when the cog is loaded
+        # (stream workers have no gateway cache, the gateway process sends dailies;
+        # cooldown reminders go out from the processes that apply cooldowns)
+        run_mode = getattr(self.bot, "run_mode", "all")
+        if run_mode != "worker":
+            self._daily_task = self.bot.loop.create_task(self.daily_reminder_task())
+        if run_mode != "gateway":
+            self._reminder_task = self.bot.loop.create_task(self.cooldown_reminder_task())
 
     async def cog_unload(self):
-        # Cancel background task on unload
-        if self._daily_task:
-            self._daily_task.cancel()
-            self._daily_task = None
+        # Cancel background tasks on unload
+        for task in (self._daily_task, self._reminder_task):
+            if task:
+                task.cancel()
+        self._daily_task = None
+        self._reminder_task = None
 
 
 # --- Extension setup ---
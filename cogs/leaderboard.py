@@ -1,9 +1,13 @@
 import os
 import re
+import time
+import asyncio
 import logging
 import discord
 from discord import app_commands
 from discord.ext import commands
+from mazoku_stream import publish_event
+from storage import RARITY_TIERS
 
 log = logging.getLogger("cog-leaderboard")
 
@@ -12,16 +16,22 @@ GUILD_ID = int(os.getenv("GUILD_ID", "0"))
 MAZOKU_BOT_ID = int(os.getenv("MAZOKU_BOT_ID", "0"))
 CHANNEL_ID = 1297601686562541608  # ✅ Only this channel counts
 
-# --- Points by rarity (Mazoku emoji IDs) ---
-RARITY_POINTS = {
-    "1342202221558763571": 1,    # Common
-    "1342202219574857788": 3,    # Rare
-    "1342202597389373530": 7,    # SR
-    "1342202212948115510": 14,   # SSR
-    "1342202203515125801": 17    # UR
+# --- Rarity tier and points by Mazoku emoji ID ---
+RARITIES = {
+    "1342202221558763571": ("Common", 1),
+    "1342202219574857788": ("Rare", 3),
+    "1342202597389373530": ("SR", 7),
+    "1342202212948115510": ("SSR", 14),
+    "1342202203515125801": ("UR", 17)
 }
 EMOJI_REGEX = re.compile(r"<a?:\w+:(\d+)>")
 
+# --- Rank tracking ---
+RANK_TOP_N = 10
+RANK_ANNOUNCE_CHANNEL_ID = int(os.getenv("RANK_ANNOUNCE_CHANNEL_ID", str(CHANNEL_ID)))
+RANK_ANNOUNCE_INTERVAL = float(os.getenv("RANK_ANNOUNCE_INTERVAL", "30"))  # seconds between posts
+RANK_ANNOUNCE_MAX_LINES = 5
+
 # --- View with Select ---
 class LeaderboardView(discord.ui.View):
     def __init__(self, bot, guild):
@@ -42,14 +52,14 @@ class LeaderboardView(discord.ui.View):
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def build_leaderboard(self, key: str, guild: discord.Guild, user: discord.Member):
-        if not getattr(self.bot, "redis", None):
+        if not getattr(self.bot, "store", None):
             return discord.Embed(
                 title="🏆 Leaderboard",
-                description="❌ Redis not connected.",
+                description="❌ Storage not connected.",
                 color=discord.Color.red()
             )
 
-        data = await self.bot.redis.hgetall(key)
+        data = await self.bot.store.get_scores(key)
         if not data:
             return discord.Embed(
                 title="🏆 Leaderboard",
@@ -78,6 +88,8 @@ class LeaderboardView(discord.ui.View):
 class Leaderboard(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self._rank_flush_task = None
+        self._rank_pending = False  # set after each push, cleared by the flusher
         log.info("⚙️ Leaderboard cog loaded with GUILD_ID=%s, MAZOKU_BOT_ID=%s", GUILD_ID, MAZOKU_BOT_ID)
 
     # --- Main command ---
@@ -90,6 +102,30 @@ class Leaderboard(commands.Cog):
         embed = await view.build_leaderboard("leaderboard", interaction.guild, interaction.user)
         await interaction.followup.send(embed=embed, view=view, ephemeral=False)
 
+    # --- Rarity stats ---
+    @app_commands.command(name="stats", description="View a player's pulls by rarity")
+    @app_commands.describe(member="Optional: the member to look up (default: you)")
+    @app_commands.guilds(discord.Object(id=GUILD_ID))
+    async def stats(self, interaction: discord.Interaction, member: discord.Member = None):
+        if not getattr(self.bot, "store", None):
+            await interaction.response.send_message("❌ Storage not connected.", ephemeral=True)
+            return
+
+        member = member or interaction.user
+        stats = await self.bot.store.get_rarity_stats(member.id)
+
+        embed = discord.Embed(
+            title="🌻 Pull stats",
+            color=discord.Color.gold()
+        )
+        embed.set_author(name=member.display_name, icon_url=member.display_avatar.url)
+        for period, label in (("all", "All time"), ("monthly", "Monthly")):
+            counts = stats[period]
+            lines = [f"**{tier}**: {counts[tier]}" for tier in RARITY_TIERS]
+            lines.append(f"Total: {sum(counts.values())}")
+            embed.add_field(name=label, value="\n".join(lines), inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     # --- Listener: claims ---
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
@@ -125,17 +161,12 @@ class Leaderboard(commands.Cog):
 
         user_id = int(match.group(1))
         member = after.guild.get_member(user_id)
-        if not member or not getattr(self.bot, "redis", None):
+        if not member or not getattr(self.bot, "store", None):
             return
 
-        # --- Prevent double counting ---
-        claim_key = f"claim:{after.id}:{user_id}"
-        if await self.bot.redis.get(claim_key):
-            return
-        await self.bot.redis.set(claim_key, "1", ex=86400)
-
         # --- Detect rarity emoji ---
         rarity_points = 0
+        rarity = None
         text_to_scan = [embed.title or "", embed.description or ""]
         if embed.fields:
             for field in embed.fields:
@@ -147,8 +178,8 @@ class Leaderboard(commands.Cog):
         for text in text_to_scan:
             matches = EMOJI_REGEX.findall(text)
             for emote_id in matches:
-                if emote_id in RARITY_POINTS:
-                    rarity_points = RARITY_POINTS[emote_id]
+                if emote_id in RARITIES:
+                    rarity, rarity_points = RARITIES[emote_id]
                     break
             if rarity_points:
                 break
@@ -156,19 +187,129 @@ class Leaderboard(commands.Cog):
         if rarity_points <= 0:
             return
 
-        # --- Check pause flags in Redis ---
-        paused_all = await self.bot.redis.get("lb:paused:all")
-        paused_monthly = await self.bot.redis.get("lb:paused:monthly")
+        record = {
+            "type": "claim",
+            "user_id": str(user_id),
+            "display_name": member.display_name,
+            "points": rarity_points,
+            "rarity": rarity,
+            "channel_id": str(after.channel.id),
+            "message_id": str(after.id),
+            "edited_at": (after.edited_at or after.created_at).timestamp(),
+        }
+        if getattr(self.bot, "run_mode", "all") == "gateway":
+            await publish_event(self.bot.redis, record)
+        else:
+            await self.apply_claim(record)
 
-        if not paused_all:
-            await self.bot.redis.hincrby("leaderboard", str(user_id), rarity_points)
-        if not paused_monthly:
-            await self.bot.redis.hincrby("activity:monthly", str(user_id), rarity_points)
-            await self.bot.redis.incrby("activity:monthly:total", rarity_points)
+    # --- Apply a claim (in-process, or from a stream worker) ---
+    async def apply_claim(self, record: dict):
+        user_id = int(record["user_id"])
+        rarity_points = int(record["points"])
+
+        # --- Check pause flags ---
+        paused_all = await self.bot.store.is_paused("all")
+        paused_monthly = await self.bot.store.is_paused("monthly")
 
-        new_global = await self.bot.redis.hget("leaderboard", str(user_id)) or "0"
+        # --- Dedupe + increment + rank before/after + overtaken (atomic, one round trip on Redis) ---
+        # The dedupe key is only written together with the score, so a
+        # redelivered record after a crash is applied instead of skipped
+        claim_key = f"claim:{record['message_id']}:{user_id}"
+        result = await self.bot.store.add_score(
+            claim_key, user_id, rarity_points, all_time=not paused_all, monthly=not paused_monthly,
+            rarity=record.get("rarity")
+        )
+        if result is None:
+            return  # already counted
+        old_rank, new_rank, new_global, overtaken = result
+
+        latency_ms = int((time.time() - float(record["edited_at"])) * 1000)
         log.info("🏅 %s gained +%s points (AutoSummon in channel %s) → Global: %s",
-                 member.display_name, rarity_points, after.channel.id, new_global)
+                 record["display_name"], rarity_points, record["channel_id"], new_global,
+                 extra={"user_id": user_id, "command": "summon", "points": rarity_points,
+                        "latency_ms": latency_ms})
+
+        if not paused_all:
+            await self.track_rank_change(user_id, record["display_name"], old_rank, new_rank, overtaken)
+
+    # --- Rank tracking ---
+    async def track_rank_change(self, user_id: int, display_name: str, old_rank, new_rank, overtaken):
+        # Ranks are 0-based and shared by ties; old_rank is None for a first-time scorer
+        if new_rank is None or new_rank >= RANK_TOP_N:
+            return
+        if old_rank is not None and old_rank <= new_rank:
+            return
+
+        position = new_rank + 1
+        if old_rank is None or old_rank >= RANK_TOP_N:
+            line = f"🌻 <@{user_id}> entered the top {RANK_TOP_N} at **#{position}**"
+        else:
+            # Only caught up with a tie: nobody was actually passed
+            if not overtaken:
+                return
+            line = f"⬆️ <@{user_id}> overtook <@{overtaken}> for **#{position}**"
+
+        log.info("📈 %s moved %s → #%s", display_name,
+                 f"#{old_rank + 1}" if old_rank is not None else "unranked", position)
+        # Pending lines and the throttle live in storage, shared by all workers
+        await self.bot.store.push_rank_event(user_id, line)
+        self._rank_pending = True
+        if not self._rank_flush_task or self._rank_flush_task.done():
+            self._rank_flush_task = asyncio.create_task(self.flush_rank_events())
+
+    async def flush_rank_events(self):
+        # Loop until nothing is left: at most one post per RANK_ANNOUNCE_INTERVAL
+        # across all processes, and moves queued during a send are not stranded
+        while True:
+            self._rank_pending = False
+            try:
+                events, wait = await self.bot.store.pop_rank_events(RANK_ANNOUNCE_INTERVAL)
+            except Exception as e:
+                log.error("❌ Failed to read rank announcements: %s", e)
+                return
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if events:
+                await self.send_rank_events(events)
+            elif not self._rank_pending:
+                return
+
+    async def send_rank_events(self, events: dict):
+        if not events:
+            return
+
+        # Partial channel: works without the gateway cache (stream workers)
+        channel = self.bot.get_partial_messageable(RANK_ANNOUNCE_CHANNEL_ID)
+
+        lines = list(events.values())
+        if len(lines) > RANK_ANNOUNCE_MAX_LINES:
+            extra = len(lines) - RANK_ANNOUNCE_MAX_LINES
+            lines = lines[-RANK_ANNOUNCE_MAX_LINES:] + [f"…and {extra} more moves"]
+
+        embed = discord.Embed(
+            title="🏆 Leaderboard update",
+            description="\n".join(lines),
+            color=discord.Color.gold()
+        )
+        try:
+            await channel.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+        except Exception as e:
+            log.error("❌ Failed to send rank announcement: %s", e)
+
+    async def cog_load(self):
+        if getattr(self.bot, "store", None):
+            try:
+                rebuilt = await self.bot.store.sync_rank_index()
+                if rebuilt:
+                    log.info("📊 Rank index rebuilt with %s entries", rebuilt)
+            except Exception as e:
+                log.error("❌ Failed to build rank index: %s", e)
+
+    async def cog_unload(self):
+        if self._rank_flush_task:
+            self._rank_flush_task.cancel()
+            self._rank_flush_task = None
 
 
 # --- Extension setup ---
@@ -31,16 +31,15 @@ class LeaderboardAdmin(commands.Cog):
     @is_admin()
     async def lb_reset(self, interaction: discord.Interaction, category: app_commands.Choice[str]):
         await interaction.response.defer(ephemeral=True)
-        if not getattr(self.bot, "redis", None):
-            await interaction.followup.send("❌ Redis not connected.", ephemeral=True)
+        if not getattr(self.bot, "store", None):
+            await interaction.followup.send("❌ Storage not connected.", ephemeral=True)
             return
 
         if category.value == "all_keys":
-            for key in ["leaderboard", "activity:monthly", "activity:monthly:total"]:
-                await self.bot.redis.delete(key)
+            await self.bot.store.reset_all_scores()
             msg = "🧹 All scores have been reset."
         else:
-            await self.bot.redis.delete(category.value)
+            await self.bot.store.reset_scores(category.value)
             msg = f"🧹 Category `{category.value}` has been reset."
 
         await interaction.followup.send(msg, ephemeral=True)
@@ -67,12 +66,11 @@ class LeaderboardAdmin(commands.Cog):
     ):
         await interaction.response.defer(ephemeral=True)
 
-        key = f"lb:paused:{category.value}"
         if state.value == "pause":
-            await self.bot.redis.set(key, "1")
+            await self.bot.store.set_paused(category.value, True)
             status = "paused"
         else:
-            await self.bot.redis.delete(key)
+            await self.bot.store.set_paused(category.value, False)
             status = "resumed"
 
         log.info("Leaderboard %s → %s", category.value, status)
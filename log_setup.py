@@ -0,0 +1,147 @@
+import os
+import sys
+import copy
+import json
+import queue
+import random
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# --- Env config ---
+# LOG_LEVEL="INFO"
+# LOG_FORMAT="text" ou "json" (une ligne JSON par record)
+# LOG_QUEUE_SIZE="10000" (records en attente avant d'être droppés)
+# LOG_SAMPLE="cog-leaderboard=0.1,cog-cooldowns=0.5" (taux gardé pour les lignes INFO et moins)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# Extra fields picked up from `log.info(..., extra={...})`
+EVENT_FIELDS = ("user_id", "command", "points", "latency_ms")
+
+
+def parse_sample_rates(value: str) -> dict:
+    rates = {}
+    for item in value.split(","):
+        name, sep, rate = item.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in EVENT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info or record.exc_text:
+            data["exc"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO/DEBUG lines for the configured loggers."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        rate = self.rates.get(record.name)
+        if rate is None:
+            return True
+        return random.random() < rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: full queue → record dropped and counted."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the stock prepare(), keep exc_info/stack_info: the listener's
+        # formatter renders the traceback (its own "exc" field in JSON), off the loop
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+class ReportingQueueListener(QueueListener):
+    """Writes a warning line whenever records were dropped since the last one handled."""
+
+    def __init__(self, log_queue, source: DroppingQueueHandler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.source = source
+        self._reported = 0
+
+    def enqueue_sentinel(self):
+        # Blocking put: the sentinel must get through even if the queue is full
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord):
+        dropped = self.source.dropped
+        if dropped > self._reported:
+            warning = logging.LogRecord(
+                "log-setup", logging.WARNING, __file__, 0,
+                "⚠️ Log queue full, %s records dropped (total %s)",
+                (dropped - self._reported, dropped), None
+            )
+            self._reported = dropped
+            super().handle(warning)
+        super().handle(record)
+
+
+def setup_logging() -> ReportingQueueListener:
+    """Route all logging through a bounded queue drained by a background thread.
+
+    Returns the started listener; call `.stop()` on shutdown to flush it.
+    """
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    listener = ReportingQueueListener(log_queue, queue_handler, stream)
+    listener.start()
+    return listener
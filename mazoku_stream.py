@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from redis.exceptions import ResponseError
+
+log = logging.getLogger("mazoku-stream")
+
+# --- Stream config ---
+# RUN_MODE=gateway publie les events Mazoku parsés ici,
+# RUN_MODE=worker les consomme via un consumer group.
+STREAM_KEY = os.getenv("MAZOKU_STREAM_KEY", "mazoku:events")
+STREAM_GROUP = os.getenv("MAZOKU_STREAM_GROUP", "mazoku-workers")
+STREAM_MAXLEN = int(os.getenv("MAZOKU_STREAM_MAXLEN", "100000"))
+STREAM_BATCH = int(os.getenv("MAZOKU_STREAM_BATCH", "50"))
+STREAM_BLOCK_MS = 5000
+# Records left unacked this long (crashed/stuck worker) are reclaimed
+STREAM_CLAIM_IDLE_MS = int(os.getenv("MAZOKU_STREAM_CLAIM_IDLE_MS", "60000"))
+# Records failing this many deliveries are logged and acked (poison records)
+STREAM_MAX_DELIVERIES = int(os.getenv("MAZOKU_STREAM_MAX_DELIVERIES", "5"))
+
+
+async def publish_event(redis, record: dict):
+    """Append a parsed Mazoku event ({"type": ..., ...}) to the stream."""
+    fields = {k: str(v) for k, v in record.items() if v is not None}
+    await redis.xadd(STREAM_KEY, fields, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+async def ensure_group(redis):
+    try:
+        await redis.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _reclaim_stale(redis, consumer: str):
+    """Take over records another worker read but never acked."""
+    _, entries, *_ = await redis.xautoclaim(
+        STREAM_KEY, STREAM_GROUP, consumer,
+        min_idle_time=STREAM_CLAIM_IDLE_MS, start_id="0-0", count=STREAM_BATCH
+    )
+    kept = []
+    for entry_id, fields in entries:
+        if not fields:
+            # Trimmed by MAXLEN ~ while pending (Redis 6.2 returns it as nil):
+            # nothing to process, just drop it from the PEL
+            if entry_id:
+                await redis.xack(STREAM_KEY, STREAM_GROUP, entry_id)
+            continue
+        pending = await redis.xpending_range(
+            STREAM_KEY, STREAM_GROUP, min=entry_id, max=entry_id, count=1
+        )
+        if pending and pending[0]["times_delivered"] > STREAM_MAX_DELIVERIES:
+            log.error("❌ Dropping %s after %s deliveries: %s",
+                      entry_id, pending[0]["times_delivered"], fields)
+            await redis.xack(STREAM_KEY, STREAM_GROUP, entry_id)
+            continue
+        kept.append((entry_id, fields))
+    return kept
+
+
+async def run_consumer(redis, consumer: str, handlers: dict, is_closed):
+    """Consume the stream until `is_closed()` is true.
+
+    Each record is acked only after its handler returns, so delivery is
+    at-least-once; handlers must be idempotent (claim/cooldown dedupe keys).
+    """
+    await ensure_group(redis)
+    log.info("📥 Worker %s consuming %s (group %s)", consumer, STREAM_KEY, STREAM_GROUP)
+
+    while not is_closed():
+        try:
+            entries = await _reclaim_stale(redis, consumer)
+            response = await redis.xreadgroup(
+                STREAM_GROUP, consumer, {STREAM_KEY: ">"},
+                count=STREAM_BATCH, block=STREAM_BLOCK_MS
+            )
+        except Exception as e:
+            log.error("❌ Stream read failed: %s", e)
+            await asyncio.sleep(1)
+            continue
+
+        for _, stream_entries in response or []:
+            entries.extend(stream_entries)
+
+        for entry_id, fields in entries:
+            if fields is None:
+                continue  # trimmed entry with no ID left to ack
+            handler = handlers.get(fields.get("type"))
+            try:
+                if handler:
+                    await handler(fields)
+                else:
+                    log.warning("⚠️ Unknown event type in %s: %s", entry_id, fields)
+                await redis.xack(STREAM_KEY, STREAM_GROUP, entry_id)
+            except Exception as e:
+                # Left pending: another pass of _reclaim_stale retries it
+                # (handlers are idempotent, so a failed ack only costs a replay)
+                log.error("❌ Processing failed for %s: %s", entry_id, e, exc_info=True)
@@ -0,0 +1,817 @@
+import os
+import json
+import time
+import asyncio
+import bisect
+import logging
+from abc import ABC, abstractmethod
+
+log = logging.getLogger("storage")
+
+# --- Backend config ---
+# STORAGE_BACKEND="redis" (défaut) ou "memory" (single-node, sans réseau)
+# MEMORY_SNAPSHOT_PATH="storage_snapshot.json", MEMORY_SNAPSHOT_INTERVAL="60" (secondes)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "redis").lower()
+MEMORY_SNAPSHOT_PATH = os.getenv("MEMORY_SNAPSHOT_PATH", "storage_snapshot.json")
+MEMORY_SNAPSHOT_INTERVAL = float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", "60"))
+
+# --- Key layout (shared by both backends, unchanged from the Redis-only days) ---
+BOARD_ALL = "leaderboard"
+BOARD_MONTHLY = "activity:monthly"
+MONTHLY_TOTAL_KEY = "activity:monthly:total"
+# Sorted-set mirror of the "leaderboard" hash, used for O(log n) rank lookups
+RANK_KEY = "leaderboard:rank"
+
+# Pending rank announcements (user_id -> line) and the throttle lock shared
+# by every process, so N stream workers still post once per interval
+RANK_EVENTS_KEY = "leaderboard:announce:pending"
+RANK_ANNOUNCE_LOCK_KEY = "leaderboard:announce:lock"
+
+# Dedupe TTLs: a stream record replayed within this window is ignored
+CLAIM_DEDUPE_TTL = 86400
+COOLDOWN_DEDUPE_TTL = 3600
+
+# cooldown:reminders -> sorted set "user_id|cmd|channel_id" scored by due
+# unix time. A claimed reminder is pushed REMINDER_LEASE seconds ahead and
+# removed once sent, so one lost with its worker is retried by another.
+REMINDERS_DUE_KEY = "cooldown:reminders"
+REMINDER_LEASE = 60
+
+# rarity:<user_id> -> one BITFIELD string per user, u32 counters:
+#   #0-#4 all-time Common/Rare/SR/SSR/UR, #5-#9 monthly (same order)
+# Periods follow the boards: paused/reset together with BOARD_ALL / BOARD_MONTHLY.
+RARITY_KEY = "rarity:{}"
+RARITY_TIERS = ("Common", "Rare", "SR", "SSR", "UR")
+RARITY_PERIODS = ("all", "monthly")
+RARITY_TYPE = "u32"
+
+# dailywheel:slot:<0-1439> -> set of user IDs due in that minute
+# dailywheel:prefs         -> hash user_id -> "HH:MM|Timezone"
+# dailywheel:slotof        -> hash user_id -> current slot
+# dailywheel:due           -> hash user_id -> absolute due minute (epoch // 60)
+# dailywheel:cursor        -> last processed absolute minute (epoch // 60)
+# A slot comes round every day but the due minute only once: after a DST
+# fall-back the next send can land later in the same UTC day.
+WHEEL_SLOT_KEY = "dailywheel:slot:{}"
+WHEEL_PREFS_KEY = "dailywheel:prefs"
+WHEEL_SLOTOF_KEY = "dailywheel:slotof"
+WHEEL_DUE_KEY = "dailywheel:due"
+WHEEL_CURSOR_KEY = "dailywheel:cursor"
+
+
+def cooldown_key(user_id, cmd: str) -> str:
+    return f"cooldown:{user_id}:{cmd}"
+
+
+def reminder_key(user_id, cmd: str) -> str:
+    return f"reminder:{user_id}:{cmd}"
+
+
+def reminder_member(user_id, cmd: str, channel_id) -> str:
+    return f"{user_id}|{cmd}|{channel_id}"
+
+
+def daily_key(user_id) -> str:
+    return f"dailyreminder:{user_id}"
+
+
+def pause_key(category: str) -> str:
+    return f"lb:paused:{category}"
+
+
+def rarity_offset(period: str, tier: str) -> str:
+    """BITFIELD offset (counter index, "#n" form) of a period/tier counter."""
+    return f"#{RARITY_PERIODS.index(period) * len(RARITY_TIERS) + RARITY_TIERS.index(tier)}"
+
+
+# --- Redis scripts ---
+# The dedupe SET NX and the writes it guards run atomically: a worker that
+# dies mid-way leaves either nothing or everything, so redelivery is safe.
+
+# KEYS: dedupe, leaderboard, rank index, monthly board, monthly total, rarity
+# ARGV: user_id, points, dedupe ttl, all_time (0/1), monthly (0/1),
+#       rarity counter type (RARITY_TYPE), rarity offsets...
+CLAIM_SCRIPT = """
+if not redis.call('SET', KEYS[1], '1', 'EX', ARGV[3], 'NX') then
+    return false
+end
+local uid, points = ARGV[1], tonumber(ARGV[2])
+local old_rank, new_rank, overtaken = false, false, false
+if ARGV[4] == '1' then
+    -- Rank = members with a strictly higher score, so ties share a position
+    local old_score = redis.call('ZSCORE', KEYS[3], uid)
+    if old_score then
+        old_rank = redis.call('ZCOUNT', KEYS[3], '(' .. old_score, '+inf')
+    end
+    redis.call('HINCRBY', KEYS[2], uid, points)
+    local new_score = redis.call('ZINCRBY', KEYS[3], points, uid)
+    new_rank = redis.call('ZCOUNT', KEYS[3], '(' .. new_score, '+inf')
+    if old_score then
+        -- Highest member that was above us and is now strictly below
+        local passed = redis.call('ZREVRANGEBYSCORE', KEYS[3],
+            '(' .. new_score, '(' .. old_score, 'LIMIT', 0, 1)
+        overtaken = passed[1] or false
+    end
+end
+if ARGV[5] == '1' then
+    redis.call('HINCRBY', KEYS[4], uid, points)
+    redis.call('INCRBY', KEYS[5], points)
+end
+if #ARGV > 6 then
+    local args = {'BITFIELD', KEYS[6], 'OVERFLOW', 'SAT'}
+    for i = 7, #ARGV do
+        table.insert(args, 'INCRBY')
+        table.insert(args, ARGV[6])
+        table.insert(args, ARGV[i])
+        table.insert(args, 1)
+    end
+    redis.call(unpack(args))
+end
+return {old_rank, new_rank, redis.call('HGET', KEYS[2], uid) or '0', overtaken}
+"""
+
+# KEYS: dedupe, cooldown, reminders
+# ARGV: cooldown seconds, dedupe ttl, reminder member, reminder due time
+COOLDOWN_SCRIPT = """
+if not redis.call('SET', KEYS[1], '1', 'EX', ARGV[2], 'NX') then
+    return false
+end
+local ttl = redis.call('TTL', KEYS[2])
+if ttl > 0 then
+    return ttl
+end
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[3])
+return 0
+"""
+
+# KEYS: reminders — ARGV: now, lease deadline, max count
+# Due members are re-scored to the lease deadline before being returned,
+# so concurrent pollers never get the same one.
+REMINDER_CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, member in ipairs(due) do
+    redis.call('ZADD', KEYS[1], ARGV[2], member)
+end
+return due
+"""
+
+
+class Storage(ABC):
+    """Operations the bot needs, independent of where the data lives.
+
+    Every method is a coroutine so cogs don't care which backend is active.
+    """
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # --- Cooldowns ---
+    @abstractmethod
+    async def cooldown_ttl(self, user_id, cmd: str) -> int:
+        """Seconds left on a cooldown, <= 0 if none."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def try_start_cooldown(self, dedupe_key: str, user_id, cmd: str, seconds: int, channel_id):
+        """Start a cooldown unless one is running, at most once per `dedupe_key`.
+
+        Starting it also schedules the end-of-cooldown reminder in
+        `channel_id`. Returns None if `dedupe_key` was already applied, the
+        seconds left if a cooldown is still running, or 0 when it was started.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_due_reminders(self, limit: int = 100) -> list:
+        """Take up to `limit` due reminders as (user_id, cmd, channel_id).
+
+        Each is leased for REMINDER_LEASE seconds: call `ack_reminder` once
+        sent, otherwise it becomes due again.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ack_reminder(self, user_id, cmd: str, channel_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear_cooldown(self, user_id, cmd: str) -> int:
+        """Remove a cooldown, return how many were removed (0 or 1)."""
+        raise NotImplementedError
+
+    # --- Preferences ---
+    @abstractmethod
+    async def get_reminder(self, user_id, cmd: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_reminder(self, user_id, cmd: str, value: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_daily_reminder(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_daily_reminder(self, user_id, value: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def daily_reminder_users(self) -> list:
+        """User IDs whose daily reminder is "on"."""
+        raise NotImplementedError
+
+    # --- Pause flags ---
+    @abstractmethod
+    async def is_paused(self, category: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_paused(self, category: str, paused: bool):
+        raise NotImplementedError
+
+    # --- Scores ---
+    @abstractmethod
+    async def add_score(self, claim_key: str, user_id, points: int, all_time: bool, monthly: bool, rarity: str = None):
+        """Apply a claim once per `claim_key`.
+
+        Returns (old_rank, new_rank, new_global, overtaken), or None when
+        `claim_key` was already applied (duplicate edit or stream
+        redelivery); the check and the writes are atomic. Ranks are 0-based
+        all-time positions counting only strictly higher scores, so ties
+        share a rank (None when unranked or when all_time is False).
+        `overtaken` is the highest member that was above the user and is now
+        strictly below, or None. `rarity` (one of RARITY_TIERS) also bumps
+        the user's pull counters for the same periods.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_rarity_stats(self, user_id) -> dict:
+        """{"all": {tier: count}, "monthly": {tier: count}}."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_scores(self, board: str) -> dict:
+        """{user_id: points} for BOARD_ALL or BOARD_MONTHLY."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reset_scores(self, board: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reset_all_scores(self):
+        raise NotImplementedError
+
+    async def sync_rank_index(self) -> int:
+        """Rebuild the rank index if missing, return the number of entries added."""
+        return 0
+
+    # --- Rank announcements ---
+    @abstractmethod
+    async def push_rank_event(self, user_id, line: str):
+        """Queue an announcement line; a newer line for the same user replaces it."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def pop_rank_events(self, interval: float):
+        """Take pending announcements if the shared throttle allows it.
+
+        Returns (events, 0) — events may be empty — or ({}, wait) with the
+        seconds to wait before the next announcement is allowed.
+        """
+        raise NotImplementedError
+
+    # --- Daily reminder schedule ---
+    @abstractmethod
+    async def get_daily_schedule(self, user_id):
+        """Return (prefs, slot) — "HH:MM|Timezone" and wheel slot, or None each."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_daily_schedule(self, user_id, slot: int, due: int, prefs: str, old_slot=None):
+        """Put the user on `slot`, due at absolute minute `due` (epoch // 60)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear_daily_schedule(self, user_id):
+        """Take the user off the wheel but keep their saved time/timezone."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def due_daily(self, slot: int, minute: int) -> set:
+        """Members of `slot` due at or before absolute `minute`.
+
+        Entries without a due minute (scheduled before it was stored) count as due.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_wheel_cursor(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_wheel_cursor(self, minute: int):
+        raise NotImplementedError
+
+
+class RedisStorage(Storage):
+    def __init__(self, redis):
+        self.redis = redis
+        self._claim_script = redis.register_script(CLAIM_SCRIPT)
+        self._cooldown_script = redis.register_script(COOLDOWN_SCRIPT)
+        self._reminder_claim_script = redis.register_script(REMINDER_CLAIM_SCRIPT)
+
+    # --- Cooldowns ---
+    async def cooldown_ttl(self, user_id, cmd):
+        return await self.redis.ttl(cooldown_key(user_id, cmd))
+
+    async def try_start_cooldown(self, dedupe_key, user_id, cmd, seconds, channel_id):
+        return await self._cooldown_script(
+            keys=[dedupe_key, cooldown_key(user_id, cmd), REMINDERS_DUE_KEY],
+            args=[seconds, COOLDOWN_DEDUPE_TTL, reminder_member(user_id, cmd, channel_id),
+                  int(time.time()) + seconds]
+        )
+
+    async def claim_due_reminders(self, limit=100):
+        now = int(time.time())
+        members = await self._reminder_claim_script(
+            keys=[REMINDERS_DUE_KEY], args=[now, now + REMINDER_LEASE, limit]
+        )
+        return [tuple(member.split("|", 2)) for member in members]
+
+    async def ack_reminder(self, user_id, cmd, channel_id):
+        await self.redis.zrem(REMINDERS_DUE_KEY, reminder_member(user_id, cmd, channel_id))
+
+    async def clear_cooldown(self, user_id, cmd):
+        return await self.redis.delete(cooldown_key(user_id, cmd))
+
+    # --- Preferences ---
+    async def get_reminder(self, user_id, cmd):
+        return await self.redis.get(reminder_key(user_id, cmd))
+
+    async def set_reminder(self, user_id, cmd, value):
+        await self.redis.set(reminder_key(user_id, cmd), value)
+
+    async def get_daily_reminder(self, user_id):
+        return await self.redis.get(daily_key(user_id))
+
+    async def set_daily_reminder(self, user_id, value):
+        await self.redis.set(daily_key(user_id), value)
+
+    async def daily_reminder_users(self):
+        users = []
+        async for key in self.redis.scan_iter(match="dailyreminder:*", count=500):
+            user_id = key.split(":", 1)[1]
+            if user_id.isdigit() and await self.redis.get(key) == "on":
+                users.append(user_id)
+        return users
+
+    # --- Pause flags ---
+    async def is_paused(self, category):
+        return bool(await self.redis.get(pause_key(category)))
+
+    async def set_paused(self, category, paused):
+        if paused:
+            await self.redis.set(pause_key(category), "1")
+        else:
+            await self.redis.delete(pause_key(category))
+
+    # --- Scores ---
+    async def add_score(self, claim_key, user_id, points, all_time, monthly, rarity=None):
+        user_id = str(user_id)
+        offsets = []
+        if rarity in RARITY_TIERS:
+            offsets = [rarity_offset(period, rarity)
+                       for period, on in zip(RARITY_PERIODS, (all_time, monthly)) if on]
+        # Dedupe + increment + rank before/after + overtaken member + rarity
+        # counters in one round trip
+        result = await self._claim_script(
+            keys=[claim_key, BOARD_ALL, RANK_KEY, BOARD_MONTHLY, MONTHLY_TOTAL_KEY,
+                  RARITY_KEY.format(user_id)],
+            args=[user_id, points, CLAIM_DEDUPE_TTL, int(all_time), int(monthly), RARITY_TYPE, *offsets]
+        )
+        if result is None:
+            return None
+        old_rank, new_rank, new_global, overtaken = result
+        return old_rank, new_rank, int(new_global), overtaken
+
+    async def get_rarity_stats(self, user_id):
+        # Every counter of both periods in a single BITFIELD GET call
+        op = self.redis.bitfield(RARITY_KEY.format(user_id))
+        for period in RARITY_PERIODS:
+            for tier in RARITY_TIERS:
+                op.get(RARITY_TYPE, rarity_offset(period, tier))
+        values = iter(await op.execute())
+        return {period: {tier: next(values) for tier in RARITY_TIERS} for period in RARITY_PERIODS}
+
+    async def _clear_rarity(self, period=None):
+        """Zero one period's counters for every user (None = delete them all)."""
+        async for key in self.redis.scan_iter(match=RARITY_KEY.format("*"), count=500):
+            if period is None:
+                await self.redis.delete(key)
+                continue
+            op = self.redis.bitfield(key)
+            for tier in RARITY_TIERS:
+                op.set(RARITY_TYPE, rarity_offset(period, tier), 0)
+            await op.execute()
+
+    async def get_scores(self, board):
+        data = await self.redis.hgetall(board)
+        return {uid: int(score) for uid, score in data.items()}
+
+    async def reset_scores(self, board):
+        await self.redis.delete(board)
+        if board == BOARD_ALL:
+            # Keep the rank index in sync with the all-time hash
+            await self.redis.delete(RANK_KEY)
+        await self._clear_rarity("all" if board == BOARD_ALL else "monthly")
+
+    async def reset_all_scores(self):
+        await self.redis.delete(BOARD_ALL, RANK_KEY, BOARD_MONTHLY, MONTHLY_TOTAL_KEY)
+        await self._clear_rarity()
+
+    async def sync_rank_index(self):
+        if await self.redis.exists(RANK_KEY):
+            return 0
+        data = await self.redis.hgetall(BOARD_ALL)
+        if data:
+            await self.redis.zadd(RANK_KEY, {uid: int(score) for uid, score in data.items()})
+        return len(data)
+
+    # --- Rank announcements ---
+    async def push_rank_event(self, user_id, line):
+        await self.redis.hset(RANK_EVENTS_KEY, str(user_id), line)
+
+    async def pop_rank_events(self, interval):
+        if not await self.redis.exists(RANK_EVENTS_KEY):
+            return {}, 0
+        # Whoever sets the lock posts; the others wait for it to expire
+        if not await self.redis.set(RANK_ANNOUNCE_LOCK_KEY, "1", px=int(interval * 1000), nx=True):
+            pttl = await self.redis.pttl(RANK_ANNOUNCE_LOCK_KEY)
+            return {}, max(pttl, 100) / 1000
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(RANK_EVENTS_KEY)
+            pipe.delete(RANK_EVENTS_KEY)
+            events, _ = await pipe.execute()
+        return events, 0
+
+    # --- Daily reminder schedule ---
+    async def get_daily_schedule(self, user_id):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(WHEEL_PREFS_KEY, str(user_id))
+            pipe.hget(WHEEL_SLOTOF_KEY, str(user_id))
+            prefs, slot = await pipe.execute()
+        return prefs, int(slot) if slot is not None else None
+
+    async def set_daily_schedule(self, user_id, slot, due, prefs, old_slot=None):
+        user_id = str(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if old_slot is not None and int(old_slot) != slot:
+                pipe.srem(WHEEL_SLOT_KEY.format(old_slot), user_id)
+            pipe.sadd(WHEEL_SLOT_KEY.format(slot), user_id)
+            pipe.hset(WHEEL_SLOTOF_KEY, user_id, slot)
+            pipe.hset(WHEEL_DUE_KEY, user_id, due)
+            pipe.hset(WHEEL_PREFS_KEY, user_id, prefs)
+            await pipe.execute()
+
+    async def clear_daily_schedule(self, user_id):
+        user_id = str(user_id)
+        old_slot = await self.redis.hget(WHEEL_SLOTOF_KEY, user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if old_slot is not None:
+                pipe.srem(WHEEL_SLOT_KEY.format(old_slot), user_id)
+            pipe.hdel(WHEEL_SLOTOF_KEY, user_id)
+            pipe.hdel(WHEEL_DUE_KEY, user_id)
+            await pipe.execute()
+
+    async def due_daily(self, slot, minute):
+        members = list(await self.redis.smembers(WHEEL_SLOT_KEY.format(slot)))
+        if not members:
+            return set()
+        dues = await self.redis.hmget(WHEEL_DUE_KEY, members)
+        return {uid for uid, due in zip(members, dues) if due is None or int(due) <= minute}
+
+    async def get_wheel_cursor(self):
+        cursor = await self.redis.get(WHEEL_CURSOR_KEY)
+        return int(cursor) if cursor else None
+
+    async def set_wheel_cursor(self, minute):
+        await self.redis.set(WHEEL_CURSOR_KEY, minute)
+
+
+class MemoryStorage(Storage):
+    """In-process backend: no network hop, TTLs checked on read, periodic JSON snapshot.
+
+    Rarity counters are plain hash fields here; the packed BITFIELD layout
+    only matters on Redis.
+
+    Single process only — RUN_MODE=gateway/worker still need Redis.
+    """
+
+    def __init__(self, snapshot_path: str = MEMORY_SNAPSHOT_PATH, snapshot_interval: float = MEMORY_SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._strings = {}  # key -> str
+        self._expiry = {}   # key -> unix timestamp (wall clock, survives snapshots)
+        self._hashes = {}   # key -> {field: str}
+        self._sets = {}     # key -> set(str)
+        self._rank_index = []  # sorted (score, user_id) mirror of BOARD_ALL
+        self._rank_events = {}
+        self._last_rank_flush = 0.0
+        self._snapshot_task = None
+        self.load_snapshot()
+
+    # --- Internal helpers ---
+    def _get(self, key):
+        expires_at = self._expiry.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._strings.pop(key, None)
+            self._expiry.pop(key, None)
+            return None
+        return self._strings.get(key)
+
+    def _set(self, key, value, ttl=None):
+        self._strings[key] = str(value)
+        if ttl is None:
+            self._expiry.pop(key, None)
+        else:
+            self._expiry[key] = time.time() + ttl
+
+    def _delete(self, key) -> int:
+        self._expiry.pop(key, None)
+        found = self._strings.pop(key, None) is not None
+        found = (self._hashes.pop(key, None) is not None) or found
+        found = (self._sets.pop(key, None) is not None) or found
+        return int(found)
+
+    def _mark_seen(self, key, ttl) -> bool:
+        if self._get(key) is not None:
+            return False
+        self._set(key, "1", ttl=ttl)
+        return True
+
+    def _purge_expired(self):
+        now = time.time()
+        for key in [k for k, t in self._expiry.items() if t <= now]:
+            self._strings.pop(key, None)
+            self._expiry.pop(key, None)
+
+    # --- Rank index ---
+    # Sorted list of (score, user_id), ascending like the Redis sorted set.
+    # Updated with bisect on each claim, never re-sorted.
+    def _rebuild_rank_index(self):
+        board = self._hashes.get(BOARD_ALL, {})
+        self._rank_index = sorted((int(score), uid) for uid, score in board.items())
+
+    def _count_above(self, score: int) -> int:
+        # Same as ZCOUNT (score +inf: scores are integers
+        return len(self._rank_index) - bisect.bisect_left(self._rank_index, (score + 1,))
+
+    # --- Snapshots ---
+    def load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("❌ Failed to load snapshot %s: %s", self.snapshot_path, e)
+            return
+        self._strings = data.get("strings", {})
+        self._expiry = data.get("expiry", {})
+        self._hashes = data.get("hashes", {})
+        self._sets = {k: set(v) for k, v in data.get("sets", {}).items()}
+        self._purge_expired()
+        self._rebuild_rank_index()
+        log.info("📂 Loaded storage snapshot (%s keys)",
+                 len(self._strings) + len(self._hashes) + len(self._sets))
+
+    def _dump(self) -> str:
+        self._purge_expired()
+        return json.dumps({
+            "strings": self._strings,
+            "expiry": self._expiry,
+            "hashes": self._hashes,
+            "sets": {k: sorted(v) for k, v in self._sets.items()},
+        })
+
+    @staticmethod
+    def _write(path: str, payload: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+    async def snapshot(self):
+        if not self.snapshot_path:
+            return
+        # Serialize on the loop (consistent view), write from a thread
+        payload = self._dump()
+        try:
+            await asyncio.to_thread(self._write, self.snapshot_path, payload)
+        except OSError as e:
+            log.error("❌ Failed to write snapshot %s: %s", self.snapshot_path, e)
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self.snapshot()
+
+    async def start(self):
+        if self.snapshot_path and self.snapshot_interval > 0:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self):
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        await self.snapshot()
+
+    # --- Cooldowns ---
+    async def cooldown_ttl(self, user_id, cmd):
+        key = cooldown_key(user_id, cmd)
+        if self._get(key) is None:
+            return -2
+        expires_at = self._expiry.get(key)
+        if expires_at is None:
+            return -1
+        return max(1, int(expires_at - time.time()))
+
+    async def try_start_cooldown(self, dedupe_key, user_id, cmd, seconds, channel_id):
+        if not self._mark_seen(dedupe_key, COOLDOWN_DEDUPE_TTL):
+            return None
+        ttl = await self.cooldown_ttl(user_id, cmd)
+        if ttl > 0:
+            return ttl
+        self._set(cooldown_key(user_id, cmd), "1", ttl=seconds)
+        # Kept as a hash (member -> due time) so snapshots cover it
+        reminders = self._hashes.setdefault(REMINDERS_DUE_KEY, {})
+        reminders[reminder_member(user_id, cmd, channel_id)] = str(int(time.time()) + seconds)
+        return 0
+
+    async def claim_due_reminders(self, limit=100):
+        now = int(time.time())
+        reminders = self._hashes.get(REMINDERS_DUE_KEY, {})
+        due = sorted((int(at), member) for member, at in reminders.items() if int(at) <= now)[:limit]
+        for _, member in due:
+            reminders[member] = str(now + REMINDER_LEASE)
+        return [tuple(member.split("|", 2)) for _, member in due]
+
+    async def ack_reminder(self, user_id, cmd, channel_id):
+        self._hashes.get(REMINDERS_DUE_KEY, {}).pop(reminder_member(user_id, cmd, channel_id), None)
+
+    async def clear_cooldown(self, user_id, cmd):
+        key = cooldown_key(user_id, cmd)
+        if self._get(key) is None:
+            return 0
+        return self._delete(key)
+
+    # --- Preferences ---
+    async def get_reminder(self, user_id, cmd):
+        return self._get(reminder_key(user_id, cmd))
+
+    async def set_reminder(self, user_id, cmd, value):
+        self._set(reminder_key(user_id, cmd), value)
+
+    async def get_daily_reminder(self, user_id):
+        return self._get(daily_key(user_id))
+
+    async def set_daily_reminder(self, user_id, value):
+        self._set(daily_key(user_id), value)
+
+    async def daily_reminder_users(self):
+        return [
+            key.split(":", 1)[1] for key in list(self._strings)
+            if key.startswith("dailyreminder:") and key.split(":", 1)[1].isdigit()
+            and self._get(key) == "on"
+        ]
+
+    # --- Pause flags ---
+    async def is_paused(self, category):
+        return bool(self._get(pause_key(category)))
+
+    async def set_paused(self, category, paused):
+        if paused:
+            self._set(pause_key(category), "1")
+        else:
+            self._delete(pause_key(category))
+
+    # --- Scores ---
+    async def add_score(self, claim_key, user_id, points, all_time, monthly, rarity=None):
+        if not self._mark_seen(claim_key, CLAIM_DEDUPE_TTL):
+            return None
+        user_id = str(user_id)
+        if rarity in RARITY_TIERS:
+            counters = self._hashes.setdefault(RARITY_KEY.format(user_id), {})
+            for period, on in zip(RARITY_PERIODS, (all_time, monthly)):
+                if on:
+                    field = f"{period}:{rarity}"
+                    counters[field] = str(min(int(counters.get(field, 0)) + 1, 2 ** 32 - 1))
+        board = self._hashes.setdefault(BOARD_ALL, {})
+        old_rank = new_rank = overtaken = None
+        if all_time:
+            old_score = int(board[user_id]) if user_id in board else None
+            if old_score is not None:
+                old_rank = self._count_above(old_score)
+                del self._rank_index[bisect.bisect_left(self._rank_index, (old_score, user_id))]
+            new_score = (old_score or 0) + points
+            board[user_id] = str(new_score)
+            bisect.insort(self._rank_index, (new_score, user_id))
+            new_rank = self._count_above(new_score)
+            if old_score is not None:
+                # Highest member that was above us and is now strictly below
+                below = bisect.bisect_left(self._rank_index, (new_score,)) - 1
+                if below >= 0 and self._rank_index[below][0] > old_score:
+                    overtaken = self._rank_index[below][1]
+        if monthly:
+            monthly_board = self._hashes.setdefault(BOARD_MONTHLY, {})
+            monthly_board[user_id] = str(int(monthly_board.get(user_id, 0)) + points)
+            self._set(MONTHLY_TOTAL_KEY, int(self._get(MONTHLY_TOTAL_KEY) or 0) + points)
+        return old_rank, new_rank, int(board.get(user_id, 0)), overtaken
+
+    async def get_scores(self, board):
+        return {uid: int(score) for uid, score in self._hashes.get(board, {}).items()}
+
+    async def get_rarity_stats(self, user_id):
+        counters = self._hashes.get(RARITY_KEY.format(user_id), {})
+        return {
+            period: {tier: int(counters.get(f"{period}:{tier}", 0)) for tier in RARITY_TIERS}
+            for period in RARITY_PERIODS
+        }
+
+    def _clear_rarity(self, period=None):
+        prefix = RARITY_KEY.format("")
+        for key in [k for k in self._hashes if k.startswith(prefix)]:
+            if period is None:
+                self._delete(key)
+                continue
+            for tier in RARITY_TIERS:
+                self._hashes[key].pop(f"{period}:{tier}", None)
+
+    async def reset_scores(self, board):
+        self._delete(board)
+        if board == BOARD_ALL:
+            self._rank_index = []
+        self._clear_rarity("all" if board == BOARD_ALL else "monthly")
+
+    async def reset_all_scores(self):
+        for key in (BOARD_ALL, BOARD_MONTHLY, MONTHLY_TOTAL_KEY):
+            self._delete(key)
+        self._rank_index = []
+        self._clear_rarity()
+
+    # --- Rank announcements (not snapshotted) ---
+    async def push_rank_event(self, user_id, line):
+        self._rank_events[str(user_id)] = line
+
+    async def pop_rank_events(self, interval):
+        if not self._rank_events:
+            return {}, 0
+        wait = self._last_rank_flush + interval - time.monotonic()
+        if wait > 0:
+            return {}, wait
+        events, self._rank_events = self._rank_events, {}
+        self._last_rank_flush = time.monotonic()
+        return events, 0
+
+    # --- Daily reminder schedule ---
+    async def get_daily_schedule(self, user_id):
+        prefs = self._hashes.get(WHEEL_PREFS_KEY, {}).get(str(user_id))
+        slot = self._hashes.get(WHEEL_SLOTOF_KEY, {}).get(str(user_id))
+        return prefs, int(slot) if slot is not None else None
+
+    async def set_daily_schedule(self, user_id, slot, due, prefs, old_slot=None):
+        user_id = str(user_id)
+        if old_slot is not None and int(old_slot) != slot:
+            self._sets.get(WHEEL_SLOT_KEY.format(old_slot), set()).discard(user_id)
+        self._sets.setdefault(WHEEL_SLOT_KEY.format(slot), set()).add(user_id)
+        self._hashes.setdefault(WHEEL_SLOTOF_KEY, {})[user_id] = str(slot)
+        self._hashes.setdefault(WHEEL_DUE_KEY, {})[user_id] = str(due)
+        self._hashes.setdefault(WHEEL_PREFS_KEY, {})[user_id] = prefs
+
+    async def clear_daily_schedule(self, user_id):
+        user_id = str(user_id)
+        old_slot = self._hashes.get(WHEEL_SLOTOF_KEY, {}).pop(user_id, None)
+        self._hashes.get(WHEEL_DUE_KEY, {}).pop(user_id, None)
+        if old_slot is not None:
+            self._sets.get(WHEEL_SLOT_KEY.format(old_slot), set()).discard(user_id)
+
+    async def due_daily(self, slot, minute):
+        dues = self._hashes.get(WHEEL_DUE_KEY, {})
+        return {
+            uid for uid in self._sets.get(WHEEL_SLOT_KEY.format(slot), ())
+            if uid not in dues or int(dues[uid]) <= minute
+        }
+
+    async def get_wheel_cursor(self):
+        cursor = self._get(WHEEL_CURSOR_KEY)
+        return int(cursor) if cursor else None
+
+    async def set_wheel_cursor(self, minute):
+        self._set(WHEEL_CURSOR_KEY, minute)